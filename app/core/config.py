@@ -3,6 +3,7 @@ Application configuration settings.
 """
 import os
 from functools import lru_cache
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -13,6 +14,8 @@ class Settings(BaseSettings):
     app_name: str = "Japanese Railway Translation API"
     app_version: str = "1.0.0"
     debug: bool = False
+    # Defaults to DEBUG when debug is set, INFO otherwise
+    log_level: Optional[str] = None
     
     # Model settings
     ner_model_name: str = "linhdzqua148/xlm-roberta-ner-japanese-railway"
@@ -20,10 +23,28 @@ class Settings(BaseSettings):
     
     # Entity mapping
     entity_csv_path: str = "./train_entity.csv"
+    entity_lookup_workers: int = 8
+    wikidata_cache_dir: str = "./.cache/wikidata"
     
     # Device settings
     use_cuda: bool = True
     
+    # Inference settings
+    batch_max_size: int = 8
+    batch_max_latency_ms: float = 10.0
+    translation_num_beams: int = 6
+    use_torch_compile: bool = True
+    compile_translation_model: bool = False
+    use_torchscript: bool = False
+    use_onnx: bool = False
+    onnx_cache_dir: str = "./.cache/onnx"
+    precision: Literal["auto", "fp32", "fp16", "bf16", "int8"] = "auto"
+    
+    # Cache settings
+    translation_cache_size: int = 10000
+    entity_cache_size: int = 50000
+    token_cache_size: int = 10000
+    
     # API settings
     max_text_length: int = 1000
     request_timeout: int = 30
@@ -1,13 +1,19 @@
 """
 FastAPI application for Japanese Railway Translation API.
 """
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from loguru import logger
 
 from .core.config import get_settings
 from .routers.translation_router import router as translation_router
+from .services.ner_service import NERService
+from .services.translation_service import TranslationService
+from .services.orchestrator import TranslationOrchestrator
 
 
 @asynccontextmanager
@@ -18,21 +24,48 @@ async def lifespan(app: FastAPI):
     print(f"🚀 Starting {settings.app_name} v{settings.app_version}")
     print(f"🔧 Device: {'CUDA' if settings.use_cuda else 'CPU'}")
     
+    # Load models once and share them across requests. All model calls go through
+    # a single worker thread: the event loop stays free and the GPU isn't oversubscribed
+    inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+    ner_service = NERService(executor=inference_executor)
+    translation_service = TranslationService(executor=inference_executor)
+    await ner_service.start()
+    await translation_service.start()
+    
+    # Warm up so the first request doesn't pay allocation/kernel selection/compilation cost
+    print("🔥 Warming up models")
+    await ner_service.warmup()
+    await translation_service.warmup()
+    
+    app.state.ner = ner_service
+    app.state.mt = translation_service
+    app.state.orchestrator = TranslationOrchestrator(ner_service, translation_service)
+    print("✅ Models loaded")
+    
     yield
     
     # Shutdown
     print("👋 Shutting down application")
+    await ner_service.stop()
+    await translation_service.stop()
+    inference_executor.shutdown(wait=True)
 
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application."""
     settings = get_settings()
     
+    # Records below the configured level are dropped before their message is formatted
+    log_level = settings.log_level or ("DEBUG" if settings.debug else "INFO")
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+    
     app = FastAPI(
         title=settings.app_name,
         version=settings.app_version,
         description="API for translating Japanese railway announcements to English",
         lifespan=lifespan,
+        default_response_class=ORJSONResponse,
         docs_url="/docs" if settings.debug else None,
         redoc_url="/redoc" if settings.debug else None,
     )
@@ -63,7 +96,7 @@ def create_app() -> FastAPI:
     @app.exception_handler(Exception)
     async def global_exception_handler(request, exc):
         """Global exception handler."""
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "error": "Internal server error",
@@ -3,6 +3,8 @@ Translation request and response models.
 """
 from pydantic import BaseModel, Field
 
+from ..core.config import get_settings
+
 
 class TranslateRequest(BaseModel):
     """Request model for translation endpoint"""
@@ -10,7 +12,7 @@ class TranslateRequest(BaseModel):
         ...,
         description="Japanese text to translate",
         min_length=1,
-        max_length=1000,
+        max_length=get_settings().max_text_length,
         example="日本語の文章"
     )
 
@@ -0,0 +1,161 @@
+"""
+Async micro-batching for model inference.
+"""
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+from loguru import logger
+
+InputT = TypeVar("InputT")
+OutputT = TypeVar("OutputT")
+
+
+class BatchedInferencer(Generic[InputT, OutputT]):
+    """
+    Coalesce concurrent inference calls into a single batched model call.
+
+    Callers `await submit(item)`; a background task collects items arriving
+    within `max_latency_ms` of the first one (up to `max_batch` items), runs
+    `batch_fn` once on the whole list and resolves each caller's future with
+    the matching output.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[InputT]], List[OutputT]],
+        max_batch: int = 8,
+        max_latency_ms: float = 10.0,
+        name: str = "batcher",
+        executor: Optional[Executor] = None
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            batch_fn: Blocking function mapping a list of inputs to a list of outputs
+            max_batch: Maximum number of items per batch
+            max_latency_ms: Maximum time to wait for a batch to fill up
+            name: Name used in log messages
+            executor: Executor the blocking batch function runs on (default loop executor)
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.max_latency = max(0.0, max_latency_ms) / 1000
+        self.name = name
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the background batching task is running."""
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start the background batching task on the running event loop."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name=self.name)
+        logger.info(f"Batcher started: name={self.name}, max_batch={self.max_batch}")
+
+    async def stop(self) -> None:
+        """Stop the background task and fail any pending requests."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} stopped"))
+        logger.info(f"Batcher stopped: name={self.name}")
+
+    async def submit(self, item: InputT) -> OutputT:
+        """
+        Queue an item for batched inference and wait for its result.
+
+        Args:
+            item: Single model input
+
+        Returns:
+            Model output for the given input
+        """
+        if not self.running:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[InputT, asyncio.Future]]:
+        """Wait for the first item, then gather more until the batch is full or the window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_latency
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _infer(self, inputs: List[InputT]) -> List[OutputT]:
+        """Run the batch function off the event loop and check it returned one output per input."""
+        loop = asyncio.get_running_loop()
+        outputs = await loop.run_in_executor(self.executor, self.batch_fn, inputs)
+        if len(outputs) != len(inputs):
+            raise RuntimeError(
+                f"{self.name} returned {len(outputs)} outputs for {len(inputs)} inputs"
+            )
+        return outputs
+
+    async def _run(self) -> None:
+        """Background loop: collect a batch, run inference off the event loop, resolve futures."""
+        while True:
+            batch = await self._collect()
+            inputs = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+
+            try:
+                try:
+                    outputs = await self._infer(inputs)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Batched inference failed: name={self.name}, batch_size={len(inputs)}, error={e}")
+                    if len(batch) == 1:
+                        if not futures[0].done():
+                            futures[0].set_exception(e)
+                        continue
+                    # One bad input (or an OOM on a large batch) shouldn't fail the unrelated
+                    # requests it was coalesced with: retry each item on its own
+                    outputs = []
+                    for item, future in batch:
+                        try:
+                            outputs.append((await self._infer([item]))[0])
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception as item_error:
+                            outputs.append(None)
+                            if not future.done():
+                                future.set_exception(item_error)
+            except asyncio.CancelledError:
+                for future in futures:
+                    if not future.done():
+                        future.cancel()
+                raise
+
+            for future, output in zip(futures, outputs):
+                if not future.done():
+                    future.set_result(output)
@@ -1,79 +1,223 @@
 """
 Named Entity Recognition service for Japanese railway entities.
 """
+import asyncio
+import numpy as np
 import torch
 from transformers import AutoTokenizer, AutoModelForTokenClassification
-from typing import List, Tuple, Dict
-import MeCab
+from concurrent.futures import Executor
+from typing import List, Tuple, Dict, Optional
 from loguru import logger
 
+from .batcher import BatchedInferencer
 from ..core.config import get_settings
-from ..utils.text_processing import setup_mecab, tokenize_japanese_text, normalize_entity
+from ..utils.model_utils import (
+    LENGTH_BUCKETS, freeze_for_cpu, get_inference_dtype, quantize_linear_int8, round_up_to_bucket,
+    row_buckets, should_quantize
+)
+from ..utils.text_processing import (
+    get_tagger, tokenize_japanese_text, normalize_entity, replace_all,
+    find_first_occurrences
+)
+
+
+# NER sees whole texts rather than sentences, so it also needs buckets up to the model's 512 limit
+NER_LENGTH_BUCKETS = LENGTH_BUCKETS + (256, 512)
 
 
 class NERService:
     """Named Entity Recognition service for Japanese railway entities."""
     
-    def __init__(self):
-        """Initialize NER service with model and tokenizer."""
+    def __init__(self, executor: Optional[Executor] = None):
+        """
+        Initialize NER service with model and tokenizer.
+        
+        Args:
+            executor: Executor that runs batched model inference
+        """
         self.settings = get_settings()
         self.device = torch.device('cuda' if torch.cuda.is_available() and self.settings.use_cuda else 'cpu')
+        self.torch_dtype = get_inference_dtype(self.device, self.settings.precision)
         self.id_to_label = {0: 'O', 1: 'B-STATION', 2: 'I-STATION', 3: 'B-LINE', 4: 'I-LINE'}
+        self.row_buckets = row_buckets(self.settings.batch_max_size)
+        self.label_arr = np.array([self.id_to_label[i] for i in range(len(self.id_to_label))], dtype=object)
         
         # Initialize models
         self._load_models()
         
-        # Initialize MeCab
-        self.mecab = setup_mecab()
+        # Taggers are created per thread on first use; create this (event loop) thread's
+        # one now so setup errors surface at startup
+        get_tagger()
+        
+        # Coalesce concurrent requests into batched forward passes
+        self.batcher = BatchedInferencer(
+            self.predict_entities_batch,
+            max_batch=self.settings.batch_max_size,
+            max_latency_ms=self.settings.batch_max_latency_ms,
+            name="ner-batcher",
+            executor=executor
+        )
     
     def _load_models(self) -> None:
         """Load NER model and tokenizer."""
         logger.info(f"Loading NER models: {self.settings.ner_model_name}")
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.settings.ner_model_name)
+            # word_ids() used in post-processing is only available on fast tokenizers
+            self.tokenizer = AutoTokenizer.from_pretrained(self.settings.ner_model_name, use_fast=True)
             self.model = AutoModelForTokenClassification.from_pretrained(
-                self.settings.ner_model_name
+                self.settings.ner_model_name,
+                torch_dtype=self.torch_dtype,
+                attn_implementation="sdpa"
             ).to(self.device)
             self.model.eval()
+            self.compiled = self.settings.use_torch_compile and self.device.type == "cuda"
+            if self.compiled:
+                self.model = torch.compile(self.model, mode="reduce-overhead", fullgraph=False)
+            elif should_quantize(self.device, self.settings.precision):
+                self.model = quantize_linear_int8(self.model)
+            if self.settings.use_torchscript and self.device.type == "cpu":
+                example_inputs = self.tokenizer(
+                    [["東京", "駅"], ["テスト"]],
+                    return_tensors="pt",
+                    padding=True,
+                    is_split_into_words=True
+                )
+                self.model = freeze_for_cpu(self.model, dict(example_inputs))
             logger.info("NER models loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load NER models: {e}")
             raise RuntimeError(f"Failed to load NER models: {e}")
     
-    def predict_entities(self, text_tokens: List[str]) -> List[Tuple[str, str]]:
+    async def start(self) -> None:
+        """Start the background inference batcher."""
+        self.batcher.start()
+    
+    async def stop(self) -> None:
+        """Stop the background inference batcher."""
+        await self.batcher.stop()
+    
+    async def warmup(self) -> None:
+        """
+        Run the model once per input shape on the inference thread.
+        
+        When compiled, batches are padded to row_buckets x NER_LENGTH_BUCKETS, and each
+        of those shapes is compiled / CUDA-graph recorded here instead of on live requests.
+        CUDA graphs are tied to the recording thread, so this runs on the batcher's executor.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.batcher.executor, self._warmup)
+    
+    def _warmup(self) -> None:
+        """Blocking part of warmup()."""
+        if not self.compiled:
+            self.predict_entities_batch([["テスト"]])
+            return
+        
+        for length in NER_LENGTH_BUCKETS:
+            for rows in self.row_buckets:
+                inputs = {
+                    "input_ids": torch.full((rows, length), self.tokenizer.unk_token_id, device=self.device),
+                    "attention_mask": torch.ones((rows, length), dtype=torch.long, device=self.device),
+                }
+                with torch.inference_mode(), torch.autocast(device_type=self.device.type, dtype=self.torch_dtype):
+                    self.model(**inputs)
+        logger.info(f"NER warmup done: lengths={NER_LENGTH_BUCKETS}, rows={self.row_buckets}")
+    
+    def _pad_to_buckets(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        """
+        Pad a tokenized batch to the next row and length bucket for the compiled model.
+        
+        Extra positions are padding with a zero attention mask; extra rows copy the
+        first row. Callers slice the outputs back to the original shape.
+        
+        Args:
+            inputs: Tokenized batch (input_ids, attention_mask)
+            
+        Returns:
+            Padded batch
+        """
+        rows, length = inputs["input_ids"].shape
+        extra_rows = round_up_to_bucket(rows, self.row_buckets) - rows
+        extra_length = round_up_to_bucket(length, NER_LENGTH_BUCKETS) - length
+        pad_values = {"input_ids": self.tokenizer.pad_token_id}
+        
+        padded = {}
+        for name, tensor in inputs.items():
+            tensor = torch.nn.functional.pad(tensor, (0, extra_length), value=pad_values.get(name, 0))
+            if extra_rows:
+                tensor = torch.cat([tensor, tensor[:1].expand(extra_rows, -1)])
+            padded[name] = tensor
+        return padded
+    
+    async def predict_entities(self, text_tokens: List[str]) -> List[Tuple[str, str]]:
         """
         Predict entities from tokenized text.
         
+        Concurrent calls are coalesced into a single batched forward pass.
+        
         Args:
             text_tokens: List of text tokens
             
         Returns:
             List of (token, label) tuples
         """
+        if not text_tokens:
+            return []
+        return await self.batcher.submit(text_tokens)
+    
+    def predict_entities_batch(self, batch_tokens: List[List[str]]) -> List[List[Tuple[str, str]]]:
+        """
+        Predict entities for a batch of tokenized texts in one forward pass.
+        
+        Args:
+            batch_tokens: List of token lists
+            
+        Returns:
+            List of (token, label) tuple lists, one per input
+        """
         try:
             inputs = self.tokenizer(
-                text_tokens,
+                batch_tokens,
                 return_tensors="pt",
                 truncation=True,
                 padding=True,
                 is_split_into_words=True
-            ).to(self.device)
+            )
+            model_inputs = {name: inputs[name] for name in ("input_ids", "attention_mask")}
+            if self.compiled:
+                # Compiled graphs are keyed on shape: only feed it the warmed-up bucket shapes
+                model_inputs = self._pad_to_buckets(model_inputs)
+            model_inputs = {name: tensor.to(self.device) for name, tensor in model_inputs.items()}
             
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                predictions = torch.argmax(outputs.logits, dim=2)
+            with torch.inference_mode(), torch.autocast(
+                device_type=self.device.type,
+                dtype=self.torch_dtype,
+                enabled=self.device.type == "cuda"
+            ):
+                outputs = self.model(**model_inputs)
+                predictions = torch.argmax(outputs["logits"], dim=2)
             
-            word_ids = inputs.word_ids()
-            predicted_labels = []
-            seen_words = set()
+            # One device-to-host copy for the whole batch instead of a sync per subword;
+            # bucket padding (if any) is sliced off first
+            rows, length = inputs["input_ids"].shape
+            predictions = predictions[:rows, :length].cpu()
+            word_ids = torch.tensor([
+                [-1 if word_id is None else word_id for word_id in inputs.word_ids(b)]
+                for b in range(len(batch_tokens))
+            ])
             
-            for i, word_id in enumerate(word_ids):
-                if word_id is not None and word_id not in seen_words:
-                    predicted_labels.append(self.id_to_label[predictions[0][i].item()])
-                    seen_words.add(word_id)
+            # Keep the first subword of every word, skipping special tokens and padding
+            first_subword = torch.ones_like(word_ids, dtype=torch.bool)
+            first_subword[:, 1:] = word_ids[:, 1:] != word_ids[:, :-1]
+            keep = first_subword & (word_ids >= 0)
             
-            min_len = min(len(text_tokens), len(predicted_labels))
-            return list(zip(text_tokens[:min_len], predicted_labels[:min_len]))
+            results = []
+            for b, text_tokens in enumerate(batch_tokens):
+                predicted_labels = self.label_arr[predictions[b][keep[b]].numpy()]
+                min_len = min(len(text_tokens), len(predicted_labels))
+                results.append(list(zip(text_tokens[:min_len], predicted_labels[:min_len].tolist())))
+            
+            return results
             
         except Exception as e:
             raise RuntimeError(f"Failed to predict entities: {e}")
@@ -122,13 +266,7 @@ class NERService:
         Returns:
             Tuple of (placeholder_to_entity, entity_to_placeholder) mappings
         """
-        offsets = []
-        for ent in entities:
-            pos = text.find(ent)
-            if pos != -1:
-                offsets.append((pos, ent))
-        
-        offsets.sort()
+        offsets = sorted((pos, ent) for ent, pos in find_first_occurrences(text, entities).items())
         
         ph2ent = {}
         ent2ph = {}
@@ -154,50 +292,54 @@ class NERService:
         Returns:
             Text with entities replaced by placeholders
         """
-        result_text = text
-        sorted_entities = sorted(ent2ph.keys(), key=len, reverse=True)
-        
-        for ent in sorted_entities:
-            result_text = result_text.replace(ent, ent2ph[ent])
-        
-        return result_text
+        return replace_all(text, ent2ph)
     
-    def extract_entities_with_placeholders(self, text: str) -> Tuple[str, Dict[str, str]]:
+    async def extract_entities_with_placeholders(
+        self,
+        text: str,
+        strict: bool = False
+    ) -> Tuple[str, Dict[str, str]]:
         """
         Extract entities and replace with placeholders.
         
         Args:
             text: Input Japanese text
+            strict: Re-raise errors instead of returning the text without entities
             
         Returns:
             Tuple of (text_with_placeholders, placeholder_to_entity_mapping)
         """
-        logger.info(f"Starting entity extraction: text_length={len(text)}")
+        logger.info("Starting entity extraction: text_length={}", len(text))
         
         try:
             # Tokenize
-            tokens = tokenize_japanese_text(text, self.mecab)
-            logger.debug(f"Text tokenized: token_count={len(tokens)}")
+            tokens = tokenize_japanese_text(text)
+            logger.debug("Text tokenized: token_count={}", len(tokens))
             
             # Predict entities
-            predicted = self.predict_entities(tokens)
-            logger.debug(f"Entity prediction completed: predictions={len(predicted)}")
+            predicted = await self.predict_entities(tokens)
+            logger.debug("Entity prediction completed: predictions={}", len(predicted))
             
             # Extract and normalize entities
             normalized_entities = self.extract_and_normalize_entities(predicted)
-            logger.info(f"Entities normalized: entity_count={len(normalized_entities)}, entities={normalized_entities}")
+            logger.info(
+                "Entities normalized: entity_count={}, entities={}",
+                len(normalized_entities), normalized_entities
+            )
             
             # Create placeholder mapping
             ph2ent, ent2ph = self.create_placeholder_mapping(text, normalized_entities)
-            logger.debug(f"Placeholder mapping created: mapping_count={len(ph2ent)}")
+            logger.debug("Placeholder mapping created: mapping_count={}", len(ph2ent))
             
             # Mask text
             final_text = self.mask_text_with_placeholders(text, ent2ph)
-            logger.info(f"Entity extraction completed: placeholders_created={len(ph2ent)}")
+            logger.info("Entity extraction completed: placeholders_created={}", len(ph2ent))
             
             return final_text, ph2ent
             
         except Exception as e:
             logger.error(f"Entity extraction failed: {str(e)}")
+            if strict:
+                raise
             # Return original text if processing fails
             return text, {}
@@ -1,34 +1,41 @@
 """
 Main translation orchestrator service.
 """
+import hashlib
 from typing import Optional
+from cachetools import LRUCache
 from loguru import logger
 
 from .ner_service import NERService
 from .translation_service import TranslationService
+from ..core.config import get_settings
 
 
 class TranslationOrchestrator:
     """Main service that orchestrates the complete translation pipeline."""
     
-    def __init__(self):
-        """Initialize the orchestrator with NER and translation services."""
-        self._ner_service: Optional[NERService] = None
-        self._translation_service: Optional[TranslationService] = None
-    
-    @property
-    def ner_service(self) -> NERService:
-        """Lazy load NER service."""
-        if self._ner_service is None:
-            self._ner_service = NERService()
-        return self._ner_service
+    def __init__(self, ner_service: NERService, translation_service: TranslationService):
+        """
+        Initialize the orchestrator with NER and translation services.
+        
+        Args:
+            ner_service: Loaded NER service
+            translation_service: Loaded translation service
+        """
+        self.settings = get_settings()
+        self.ner_service = ner_service
+        self.translation_service = translation_service
+        
+        # Cache of full translation results, keyed by input text and model versions
+        self.model_version = f"{self.settings.ner_model_name}|{self.settings.translation_model_name}"
+        self._cache: Optional[LRUCache] = (
+            LRUCache(maxsize=self.settings.translation_cache_size)
+            if self.settings.translation_cache_size > 0 else None
+        )
     
-    @property
-    def translation_service(self) -> TranslationService:
-        """Lazy load translation service."""
-        if self._translation_service is None:
-            self._translation_service = TranslationService()
-        return self._translation_service
+    def _cache_key(self, japanese_text: str) -> bytes:
+        """Build the result cache key for an input text."""
+        return hashlib.sha256(f"{japanese_text}\x00{self.model_version}".encode("utf-8")).digest()
     
     async def translate(self, japanese_text: str) -> str:
         """
@@ -40,30 +47,44 @@ class TranslationOrchestrator:
         Returns:
             Translated English text
         """
-        logger.info(f"Starting translation orchestration: input_length={len(japanese_text)}")
+        logger.info("Starting translation orchestration: input_length={}", len(japanese_text))
+        
+        cache_key = None
+        if self._cache is not None:
+            cache_key = self._cache_key(japanese_text)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                logger.info("Translation served from cache")
+                return cached
         
+        # Services run strict here so any fallback surfaces as an exception: a degraded
+        # (partly untranslated) result must never be written to the cache
         try:
             # Step 1: Extract entities and create placeholders
             logger.info("Step 1: Extracting entities and creating placeholders")
-            text_with_placeholders, ph2ent = self.ner_service.extract_entities_with_placeholders(
-                japanese_text
+            text_with_placeholders, ph2ent = await self.ner_service.extract_entities_with_placeholders(
+                japanese_text, strict=True
+            )
+            logger.opt(lazy=True).info(
+                "Entities extracted: count={count}, entities={entities}",
+                count=lambda: len(ph2ent),
+                entities=lambda: list(ph2ent.values())
             )
-            logger.info(f"Entities extracted: count={len(ph2ent)}, entities={list(ph2ent.values())}")
             
             # Step 2: Translate with entity handling
             logger.info("Step 2: Translating with entity handling")
-            result = self.translation_service.translate_with_entity_handling(
-                japanese_text, text_with_placeholders, ph2ent
+            result = await self.translation_service.translate_with_entity_handling(
+                japanese_text, text_with_placeholders, ph2ent, strict=True
             )
             logger.info("Translation pipeline completed successfully")
             
+            if cache_key is not None and result:
+                self._cache[cache_key] = result
+            
             return result
             
         except Exception as e:
             logger.error(f"Translation pipeline failed, using fallback: {str(e)}")
-            # Fallback to simple translation
-            return self.translation_service.translate_text_simple(japanese_text)
-
+            # Fallback to simple translation; not cached
+            return await self.translation_service.translate_text_simple(japanese_text)
 
-# Global instance
-translation_orchestrator = TranslationOrchestrator()
@@ -1,29 +1,83 @@
 """
 Translation service for Japanese to English translation.
 """
+import asyncio
+import re
 import torch
+from cachetools import LRUCache
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 from loguru import logger
 
+from .batcher import BatchedInferencer
 from ..core.config import get_settings
-from ..utils.text_processing import remove_adjacent_duplicate_phrases
+from ..utils.model_utils import (
+    LENGTH_BUCKETS, get_inference_dtype, load_onnx_seq2seq, quantize_linear_int8, round_up_to_bucket,
+    row_buckets, should_quantize
+)
+from ..utils.text_processing import remove_adjacent_duplicate_phrases, replace_all, split_sentences
 from ..utils.entity_mapping import load_entity_mapping_from_csv, translate_entity_with_fallback
 
+# Japanese punctuation mapped to its English equivalent for text that skips the model
+_JA_PUNCT = {
+    '。': '. ', '、': ', ', '，': ', ', '．': '. ', '！': '! ', '？': '? ',
+    '：': ': ', '；': '; ', '・': ' ', '　': ' '
+}
+_JA_PUNCT_TABLE = str.maketrans(_JA_PUNCT)
+# Text made up only of placeholders ([PH0], ...), whitespace, ASCII sentence punctuation
+# and the punctuation above; anything else (brackets, arrows, ～, ...) still goes to the model
+_PLACEHOLDERS_ONLY_PATTERN = re.compile(
+    r'(?:\[PH\d+\]|[\s.,!?:;%s])*' % re.escape("".join(_JA_PUNCT))
+)
+
 
 class TranslationService:
     """Translation service for Japanese to English text."""
     
-    def __init__(self):
-        """Initialize translation service with model and entity mappings."""
+    def __init__(self, executor: Optional[Executor] = None):
+        """
+        Initialize translation service with model and entity mappings.
+        
+        Args:
+            executor: Executor that runs batched model inference
+        """
         self.settings = get_settings()
         self.device = torch.device('cuda' if torch.cuda.is_available() and self.settings.use_cuda else 'cpu')
+        self.torch_dtype = get_inference_dtype(self.device, self.settings.precision)
         
         # Load models
         self._load_models()
+        self._input_buffers: Dict[int, Dict[str, torch.Tensor]] = {}
+        self.row_buckets = row_buckets(self.settings.batch_max_size)
+        # Token ids of recently seen sentences; announcements repeat the same sentences a lot.
+        # Only touched from the inference thread, so no locking
+        self._token_cache: LRUCache = LRUCache(maxsize=max(1, self.settings.token_cache_size))
         
         # Load entity mapping
         self.entity_mapping = load_entity_mapping_from_csv(self.settings.entity_csv_path)
+        
+        # Per-process cache of entity translations; the mapping is captured in the
+        # closure since dicts can't be part of an lru_cache key. Lookup errors are raised
+        # rather than returned, so lru_cache only ever memoizes definitive answers
+        self._translate_entity_cached = lru_cache(maxsize=self.settings.entity_cache_size)(
+            lambda entity: translate_entity_with_fallback(entity, self.entity_mapping, raise_errors=True)
+        )
+        # Wikidata lookups are network-bound, so entities of one request are resolved concurrently
+        self._lookup_executor = ThreadPoolExecutor(
+            max_workers=max(1, self.settings.entity_lookup_workers),
+            thread_name_prefix="entity-lookup"
+        )
+        
+        # Coalesce concurrent requests into batched generate calls
+        self.batcher = BatchedInferencer(
+            self.translate_batch,
+            max_batch=self.settings.batch_max_size,
+            max_latency_ms=self.settings.batch_max_latency_ms,
+            name="mt-batcher",
+            executor=executor
+        )
     
     def _load_models(self) -> None:
         """Load translation model and tokenizer."""
@@ -31,96 +85,320 @@ class TranslationService:
         try:
             # Load tokenizer with trust_remote_code to handle custom configs
             self.tokenizer = AutoTokenizer.from_pretrained(
-                self.settings.translation_model_name,
-                trust_remote_code=True
-            )
-            # Load model with trust_remote_code and force_download to avoid config issues
-            self.model = AutoModelForSeq2SeqLM.from_pretrained(
                 self.settings.translation_model_name,
                 trust_remote_code=True,
-                local_files_only=False
-            ).to(self.device)
-            self.model.eval()
+                use_fast=True
+            )
+            # Resolve special token ids once instead of on every generate call
+            self._bos_ids = {lang: self.tokenizer.convert_tokens_to_ids(lang) for lang in ("eng_Latn",)}
+            self._pad_id = self.tokenizer.pad_token_id
+            
+            if self.settings.use_onnx:
+                # ONNX Runtime runs its own fused kernels, so torch.compile and INT8 don't apply
+                self.model = load_onnx_seq2seq(
+                    self.settings.translation_model_name, self.device, self.settings.onnx_cache_dir
+                )
+                self.compiled = False
+            else:
+                # Load model with trust_remote_code and force_download to avoid config issues
+                self.model = AutoModelForSeq2SeqLM.from_pretrained(
+                    self.settings.translation_model_name,
+                    trust_remote_code=True,
+                    local_files_only=False,
+                    torch_dtype=self.torch_dtype,
+                    # Fused scaled-dot-product attention instead of the eager matmul/softmax path
+                    attn_implementation="sdpa"
+                ).to(self.device)
+                self.model.eval()
+                
+                # generate() calls self.forward on the module, so compile the forward
+                # itself; compiling the module wrapper would leave the decode loop eager.
+                # Opt-in: M2M100 only has a dynamic KV cache, which grows every decode step,
+                # so live requests keep hitting new shapes (recompiles / CUDA graph recordings)
+                self.compiled = self.settings.compile_translation_model and self.device.type == "cuda"
+                if self.compiled:
+                    self.model.forward = torch.compile(
+                        self.model.forward, mode="reduce-overhead", fullgraph=False
+                    )
+                elif should_quantize(self.device, self.settings.precision):
+                    self.model = quantize_linear_int8(self.model)
             logger.info("Translation models loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load translation models: {e}")
             raise RuntimeError(f"Failed to load translation models: {e}")
     
-    def translate_text_simple(self, text: str) -> str:
+    async def start(self) -> None:
+        """Start the background inference batcher."""
+        self.batcher.start()
+    
+    async def stop(self) -> None:
+        """Stop the background inference batcher and the entity lookup pool."""
+        await self.batcher.stop()
+        self._lookup_executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def warmup(self) -> None:
+        """
+        Run generate on the inference thread before serving traffic.
+        
+        Eager models get a single call (allocator / kernel selection). When the model is
+        compiled, batches are padded to row_buckets x LENGTH_BUCKETS and each of those
+        input shapes is run once. That only covers the encoder and the decode lengths these
+        dummy inputs reach: with the dynamic KV cache, other decode lengths still compile
+        and record CUDA graphs on live requests.
+        CUDA graphs are tied to the recording thread, so this runs on the batcher's executor.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.batcher.executor, self._warmup)
+    
+    def _warmup(self) -> None:
+        """Blocking part of warmup()."""
+        sample = self.tokenizer("こんにちは。")["input_ids"]
+        if not self.compiled:
+            self._generate([sample])
+            return
+        
+        for bucket in LENGTH_BUCKETS:
+            # Only the shape matters here, so repeat the sample until it fills the bucket
+            ids = (sample * bucket)[:bucket]
+            for rows in self.row_buckets:
+                self._generate([ids] * rows)
+        logger.info(f"Translation warmup done: lengths={LENGTH_BUCKETS}, rows={self.row_buckets}")
+    
+    async def translate_text_simple(self, text: str, strict: bool = False) -> str:
         """
         Translate text using machine translation model.
         
+        The text is split into sentences which are submitted together, so they
+        share one batched generate call (with any concurrent requests) and long
+        inputs aren't truncated at the model's maximum length.
+        
         Args:
             text: Japanese text to translate
+            strict: Re-raise model errors instead of returning the input text
             
         Returns:
             Translated English text
         """
-        if not text.strip():
+        sentences = split_sentences(text)
+        if not sentences:
             return ""
         
         try:
-            return self.translate(text)
+            translations = await asyncio.gather(*(self.batcher.submit(s) for s in sentences))
         except Exception:
+            if strict:
+                raise
             # Return original text if translation fails
             return text
+        
+        return " ".join(t.strip() for t in translations if t.strip())
 
     def translate(self, text: str, src_lang: str = "jpn_Jpan", tgt_lang: str = "eng_Latn", max_len: int = 128) -> str:
         """
         Core translation using tokenizer + model.generate with forced BOS token.
         Mirrors the requested signature and behavior.
         """
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
-            max_length=max_len,
-            truncation=True
-        ).to(self.device)
+        return self.translate_batch([text], src_lang=src_lang, tgt_lang=tgt_lang, max_len=max_len)[0]
+
+    @staticmethod
+    def _bucket_len(n: int, max_len: int = 128) -> int:
+        """Round a token length up to the nearest of LENGTH_BUCKETS (capped at max_len)."""
+        return min(round_up_to_bucket(n, LENGTH_BUCKETS), max_len)
+
+    def _stage_batch(self, batch_ids: List[List[int]], max_len: int) -> Dict[str, torch.Tensor]:
+        """
+        Copy token ids into reusable pinned host / device buffers for their length bucket.
+        
+        Avoids allocating fresh host and device tensors per batch and lets the
+        host-to-device copy run asynchronously.
+        
+        Args:
+            batch_ids: Token ids per text
+            max_len: Maximum input length in tokens
+            
+        Returns:
+            Model inputs as views into the device buffers; when compiled, the row count
+            is padded up to a row bucket with copies of the first row
+        """
+        if self.compiled:
+            # Compiled graphs are keyed on shape, so pad the batch size as well as the length
+            padded_rows = round_up_to_bucket(len(batch_ids), self.row_buckets)
+            batch_ids = batch_ids + [batch_ids[0]] * (padded_rows - len(batch_ids))
+        rows = len(batch_ids)
+        longest = max(len(ids) for ids in batch_ids)
+        bucket = self._bucket_len(longest, max_len)
+        # Compiled graphs are keyed on shape, so pad to the full bucket; eager mode only needs the longest
+        width = bucket if self.compiled else longest
+        
+        buffers = self._input_buffers.get(bucket)
+        if buffers is None or buffers["host_ids"].numel() < rows * bucket:
+            size = max(rows, self.settings.batch_max_size) * bucket
+            buffers = self._input_buffers[bucket] = {
+                "host_ids": torch.empty(size, dtype=torch.long, pin_memory=True),
+                "host_mask": torch.empty(size, dtype=torch.long, pin_memory=True),
+                "device_ids": torch.empty(size, dtype=torch.long, device=self.device),
+                "device_mask": torch.empty(size, dtype=torch.long, device=self.device),
+            }
+        
+        # Contiguous (rows, width) views at the start of each flat buffer
+        host_ids = buffers["host_ids"][:rows * width].view(rows, width)
+        host_mask = buffers["host_mask"][:rows * width].view(rows, width)
+        ids_np, mask_np = host_ids.numpy(), host_mask.numpy()
+        ids_np.fill(self._pad_id)
+        mask_np.fill(0)
+        left_pad = self.tokenizer.padding_side == "left"
+        for row, ids in enumerate(batch_ids):
+            span = slice(width - len(ids), width) if left_pad else slice(0, len(ids))
+            ids_np[row, span] = ids
+            mask_np[row, span] = 1
+        
+        device_ids = buffers["device_ids"][:rows * width].view(rows, width)
+        device_mask = buffers["device_mask"][:rows * width].view(rows, width)
+        device_ids.copy_(host_ids, non_blocking=True)
+        device_mask.copy_(host_mask, non_blocking=True)
+        
+        return {"input_ids": device_ids, "attention_mask": device_mask}
+
+    def translate_batch(
+        self,
+        texts: List[str],
+        src_lang: str = "jpn_Jpan",
+        tgt_lang: str = "eng_Latn",
+        max_len: int = 128
+    ) -> List[str]:
+        """
+        Translate a batch of texts with a single padded generate call.
+        
+        Args:
+            texts: Japanese texts to translate
+            src_lang: Source language code
+            tgt_lang: Target language code
+            max_len: Maximum input/output length in tokens
+            
+        Returns:
+            Translated English texts, in input order
+        """
+        bos_id = self._bos_ids.get(tgt_lang)
+        if bos_id is None:
+            bos_id = self._bos_ids[tgt_lang] = self.tokenizer.convert_tokens_to_ids(tgt_lang)
+        
+        batch_ids = self._tokenize(texts, max_len)
+        return self._generate(batch_ids, bos_id=bos_id, max_len=max_len)
+
+    def _tokenize(self, texts: List[str], max_len: int) -> List[List[int]]:
+        """
+        Tokenize texts, reusing cached token ids and tokenizing the misses in one call.
+        
+        Args:
+            texts: Texts to tokenize
+            max_len: Maximum length in tokens
+            
+        Returns:
+            Token ids per text, in input order
+        """
+        batch_ids = [self._token_cache.get((text, max_len)) for text in texts]
+        misses = list({text for text, ids in zip(texts, batch_ids) if ids is None})
+        if misses:
+            tokenized = dict(zip(misses, self.tokenizer(misses, max_length=max_len, truncation=True)["input_ids"]))
+            for text, ids in tokenized.items():
+                self._token_cache[(text, max_len)] = ids
+            batch_ids = [tokenized[text] if ids is None else ids for text, ids in zip(texts, batch_ids)]
+        return batch_ids
 
-        with torch.no_grad():
+    def _generate(self, batch_ids: List[List[int]], bos_id: Optional[int] = None, max_len: int = 128) -> List[str]:
+        """
+        Pad tokenized inputs, run generate and decode the outputs.
+        
+        Args:
+            batch_ids: Source token ids per text
+            bos_id: Forced target-language BOS token id (default eng_Latn)
+            max_len: Maximum input/output length in tokens
+            
+        Returns:
+            Decoded translations, in input order
+        """
+        if bos_id is None:
+            bos_id = self._bos_ids["eng_Latn"]
+        
+        if self.device.type == "cuda":
+            inputs = self._stage_batch(batch_ids, max_len)
+        else:
+            inputs = self.tokenizer.pad({"input_ids": batch_ids}, padding=True, return_tensors="pt")
+
+        with torch.inference_mode(), torch.autocast(
+            device_type=self.device.type,
+            dtype=self.torch_dtype,
+            enabled=self.device.type == "cuda"
+        ):
             generated_tokens = self.model.generate(
                 **inputs,
-                forced_bos_token_id=self.tokenizer.convert_tokens_to_ids(tgt_lang),
-                max_length=max_len
+                forced_bos_token_id=bos_id,
+                max_length=max_len,
+                num_beams=self.settings.translation_num_beams
             )
 
-        translation = self.tokenizer.batch_decode(
-            generated_tokens,
+        # Drop outputs of rows added to fill a row bucket
+        return self.tokenizer.batch_decode(
+            generated_tokens[:len(batch_ids)],
             skip_special_tokens=True,
             clean_up_tokenization_spaces=True
-        )[0]
-        return translation
+        )
+    
+    def _translate_entity(self, entity: str, strict: bool = False) -> str:
+        """Translate one entity through the cache, keeping the original (uncached) if the lookup fails."""
+        try:
+            return self._translate_entity_cached(entity)
+        except Exception as e:
+            logger.warning("Entity lookup failed, keeping original: {} ({})", entity, e)
+            if strict:
+                raise
+            return entity.strip()
     
-    def translate_entities_with_fallback(self, ph2ent: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    def translate_entities_with_fallback(
+        self,
+        ph2ent: Dict[str, str],
+        strict: bool = False
+    ) -> Tuple[Dict[str, str], Dict[str, str]]:
         """
         Translate entities using CSV mapping and Wikidata fallback.
         
         Args:
             ph2ent: Placeholder to entity mapping
+            strict: Re-raise entity lookup errors instead of keeping the original entity
             
         Returns:
             Tuple of (translated_entities, entities_to_restore)
         """
-        updated_ph2ent = {}
-        entities_to_restore = {}
+        # CSV hits are plain dict lookups; only the rest go through the Wikidata fallback
+        csv_mapping = self.entity_mapping
+        hits = {placeholder: csv_mapping[entity] for placeholder, entity in ph2ent.items() if entity in csv_mapping}
+        misses = {placeholder: entity for placeholder, entity in ph2ent.items() if entity not in csv_mapping}
         
-        for placeholder, entity in ph2ent.items():
-            translated = translate_entity_with_fallback(entity, self.entity_mapping)
-            
-            # If translation is different from original, it was successfully translated
-            if translated != entity:
-                updated_ph2ent[placeholder] = translated
-            else:
-                # Entity couldn't be translated, restore it later
-                entities_to_restore[placeholder] = entity
+        if len(misses) > 1:
+            translations = list(self._lookup_executor.map(
+                lambda entity: self._translate_entity(entity, strict=strict), misses.values()
+            ))
+        else:
+            translations = [self._translate_entity(entity, strict=strict) for entity in misses.values()]
+        
+        # If translation is different from original, it was successfully translated;
+        # otherwise the entity is restored later
+        resolved = list(zip(misses.items(), translations))
+        updated_ph2ent = hits | {
+            placeholder: translated for (placeholder, entity), translated in resolved if translated != entity
+        }
+        entities_to_restore = {
+            placeholder: entity for (placeholder, entity), translated in resolved if translated == entity
+        }
         
         return updated_ph2ent, entities_to_restore
     
-    def restore_entities_and_translate(
+    async def restore_entities_and_translate(
         self,
         text_with_placeholders: str,
         entities_to_restore: Dict[str, str],
-        translated_entities: Dict[str, str]
+        translated_entities: Dict[str, str],
+        strict: bool = False
     ) -> Tuple[str, str, Dict[str, str]]:
         """
         Restore untranslated entities and translate the text.
@@ -129,17 +407,21 @@ class TranslationService:
             text_with_placeholders: Text with placeholders
             entities_to_restore: Entities that couldn't be translated
             translated_entities: Successfully translated entities
+            strict: Re-raise model errors instead of falling back
             
         Returns:
             Tuple of (final_text, translated_text, final_ph2ent)
         """
         # Restore untranslated entities
-        final_text = text_with_placeholders
-        for placeholder, original_entity in entities_to_restore.items():
-            final_text = final_text.replace(placeholder, original_entity)
+        final_text = replace_all(text_with_placeholders, entities_to_restore)
+        
+        # Nothing but translated entities and punctuation left: there's nothing for the model to do
+        if _PLACEHOLDERS_ONLY_PATTERN.fullmatch(final_text):
+            logger.debug("Text is placeholders only, skipping model translation")
+            return final_text, final_text.translate(_JA_PUNCT_TABLE), translated_entities
         
         # Translate the text
-        translated_text = self.translate_text_simple(final_text)
+        translated_text = await self.translate_text_simple(final_text, strict=strict)
         
         return final_text, translated_text, translated_entities
     
@@ -158,23 +440,20 @@ class TranslationService:
         Returns:
             Final translated text with entities replaced
         """
-        final_result = translated_text
-        
         # Replace placeholders with translated entities
-        for placeholder, translated_entity in final_ph2ent.items():
-            if placeholder in final_result:
-                final_result = final_result.replace(placeholder, translated_entity)
+        final_result = replace_all(translated_text, final_ph2ent)
         
         # Clean up duplicates and formatting
         final_result = remove_adjacent_duplicate_phrases(final_result)
         
         return final_result
     
-    def translate_with_entity_handling(
+    async def translate_with_entity_handling(
         self,
         text: str,
         text_with_placeholders: str,
-        ph2ent: Dict[str, str]
+        ph2ent: Dict[str, str],
+        strict: bool = False
     ) -> str:
         """
         Complete translation pipeline with entity handling.
@@ -183,27 +462,36 @@ class TranslationService:
             text: Original Japanese text
             text_with_placeholders: Text with entity placeholders
             ph2ent: Placeholder to entity mapping
+            strict: Re-raise errors instead of falling back, so callers can tell
+                a degraded (possibly untranslated) result from a real one
             
         Returns:
             Final translated English text
         """
-        logger.info(f"Starting translation with entity handling: entities_count={len(ph2ent)}")
+        logger.info("Starting translation with entity handling: entities_count={}", len(ph2ent))
         
         try:
             if not ph2ent:
                 logger.info("No entities found, using direct translation")
                 # No entities found, translate directly
-                return self.translate_text_simple(text)
+                return await self.translate_text_simple(text, strict=strict)
             
             # Translate entities
             logger.info("Translating entities with fallback")
-            translated_entities, entities_to_restore = self.translate_entities_with_fallback(ph2ent)
-            logger.info(f"Entity translation completed: translated={len(translated_entities)}, to_restore={len(entities_to_restore)}")
+            # The lookup blocks on Wikidata for CSV misses; run it in a worker thread so
+            # the event loop keeps feeding other requests' batches to the GPU meanwhile
+            translated_entities, entities_to_restore = await asyncio.to_thread(
+                self.translate_entities_with_fallback, ph2ent, strict
+            )
+            logger.info(
+                "Entity translation completed: translated={}, to_restore={}",
+                len(translated_entities), len(entities_to_restore)
+            )
             
             # Restore untranslated entities and translate text
             logger.info("Restoring entities and translating text")
-            final_text, translated_text, final_ph2ent = self.restore_entities_and_translate(
-                text_with_placeholders, entities_to_restore, translated_entities
+            final_text, translated_text, final_ph2ent = await self.restore_entities_and_translate(
+                text_with_placeholders, entities_to_restore, translated_entities, strict=strict
             )
             
             # Merge results
@@ -215,5 +503,7 @@ class TranslationService:
             
         except Exception as e:
             logger.error(f"Entity handling translation failed: {str(e)}")
+            if strict:
+                raise
             # Fallback to simple translation
-            return self.translate_text_simple(text)
+            return await self.translate_text_simple(text)
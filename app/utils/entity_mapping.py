@@ -1,13 +1,60 @@
 """
 Entity mapping utilities for loading and accessing entity translations.
 """
+import diskcache
 import pandas as pd
 import requests
 import re
+import threading
 from typing import Dict, Optional
 from functools import lru_cache
+from cachetools import LRUCache
 from loguru import logger
 
+from ..core.config import get_settings
+
+# Shared session so Wikidata lookups reuse pooled keep-alive connections
+# instead of a new TCP + TLS handshake per request
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+})
+
+# Lookup filters, built once at import
+_PUNCT = frozenset({'。', '、', '，', '．', '！', '？', '：', '；'})
+_PARTICLES = frozenset({
+    'は', 'を', 'が', 'に', 'で', 'と', 'の', 'か', 'から', 'まで', 'も', 'へ', 'より', 'だけ', 'ばかり',
+    'くらい', 'ほど', 'など', 'しか', 'でも', 'だって', 'って', 'なら', 'たら', 'れば', 'けれど',
+    'けど', 'のに', 'ので', 'ため', 'ように', 'ために', 'として', 'について',
+    'によって', 'に関して', 'に対して', 'において'
+})
+_RAILWAY_INDICATOR_RE = re.compile('|'.join(map(re.escape, [
+    '駅', '線', 'メトロ', 'Metro', '鉄道', '電車', '新幹線', 'JR', '方面', '地下鉄'
+])))
+_RAILWAY_KEYWORD_RE = re.compile('|'.join(map(re.escape, [
+    'station', 'railway', 'train', 'metro', 'line', 'subway', 'transit'
+])))
+
+_WIKIDATA_API_URL = "https://www.wikidata.org/w/api.php"
+
+# Wikidata answers (including "not found") persisted across restarts and shared between workers
+_WIKIDATA_CACHE_TTL = 30 * 24 * 3600
+_MISSING = object()
+
+# Hot entities in memory on top of the disk cache. Like the disk cache it only holds
+# definitive answers, so a request error is retried on the next lookup
+_WIKIDATA_MEMORY: LRUCache = LRUCache(maxsize=1000)
+_WIKIDATA_MEMORY_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _wikidata_cache() -> Optional[diskcache.Cache]:
+    """Open the on-disk Wikidata cache, or None when disabled."""
+    cache_dir = get_settings().wikidata_cache_dir
+    if not cache_dir:
+        return None
+    return diskcache.Cache(cache_dir)
+
 
 def load_entity_mapping_from_csv(file_path: str) -> Dict[str, str]:
     """
@@ -22,14 +69,15 @@ def load_entity_mapping_from_csv(file_path: str) -> Dict[str, str]:
     logger.info(f"Loading entity mapping from CSV: {file_path}")
     
     try:
-        df = pd.read_csv(file_path, encoding='utf-8')
+        # Only the two mapping columns are read; empty fields come back as NA
+        df = pd.read_csv(file_path, encoding='utf-8', usecols=['kanji', 'english'], dtype='string')
         
-        # Clean data
-        df_clean = df.dropna(subset=['kanji', 'english'])
-        df_clean = df_clean[(df_clean['kanji'] != '') & (df_clean['english'] != '')]
+        # Clean data in one pass
+        keep = (df['kanji'].str.len() > 0) & (df['english'].str.len() > 0)
+        df_clean = df[keep.fillna(False)]
         
         # Create mapping dictionary
-        entity_mapping = dict(zip(df_clean['kanji'], df_clean['english']))
+        entity_mapping = dict(zip(df_clean['kanji'].to_numpy(), df_clean['english'].to_numpy()))
         logger.info(f"Entity mapping loaded successfully: {len(entity_mapping)} mappings")
         
         return entity_mapping
@@ -39,13 +87,14 @@ def load_entity_mapping_from_csv(file_path: str) -> Dict[str, str]:
         raise FileNotFoundError(f"Failed to load entity mapping from {file_path}: {e}")
 
 
-@lru_cache(maxsize=1000)
-def get_entity_from_wikidata(japanese_name: str) -> Optional[str]:
+def get_entity_from_wikidata(japanese_name: str, raise_errors: bool = False) -> Optional[str]:
     """
     Get English entity name from Wikidata.
     
     Args:
         japanese_name: Japanese entity name
+        raise_errors: Re-raise request errors instead of returning None, so callers
+            can tell "not found" from "lookup failed"
         
     Returns:
         English entity name if found, None otherwise
@@ -57,22 +106,11 @@ def get_entity_from_wikidata(japanese_name: str) -> Optional[str]:
     japanese_name = japanese_name.strip()
     
     # Filter out punctuation and particles
-    punctuation_chars = {'。', '、', '，', '．', '！', '？', '：', '；'}
-    if japanese_name in punctuation_chars:
-        return None
-    
-    japanese_particles = {
-        'は', 'を', 'が', 'に', 'で', 'と', 'の', 'か', 'から', 'まで', 'も', 'へ', 'より', 'だけ', 'ばかり',
-        'くらい', 'ほど', 'など', 'しか', 'でも', 'だって', 'って', 'なら', 'たら', 'れば', 'けれど',
-        'が', 'けど', 'のに', 'ので', 'から', 'ため', 'ように', 'ために', 'として', 'について',
-        'によって', 'に関して', 'に対して', 'について', 'として', 'において', 'において'
-    }
-    if japanese_name in japanese_particles:
+    if japanese_name in _PUNCT or japanese_name in _PARTICLES:
         return None
     
     # Check for railway indicators
-    railway_indicators = ['駅', '線', 'メトロ', 'Metro', '鉄道', '電車', '新幹線', 'JR', '方面', '地下鉄']
-    has_railway_indicator = any(indicator in japanese_name for indicator in railway_indicators)
+    has_railway_indicator = _RAILWAY_INDICATOR_RE.search(japanese_name) is not None
     
     # Check reasonable length
     is_reasonable_length = len(japanese_name) >= 2 and len(japanese_name) <= 25
@@ -80,56 +118,93 @@ def get_entity_from_wikidata(japanese_name: str) -> Optional[str]:
     if not (has_railway_indicator and is_reasonable_length):
         return None
     
-    try:
-        # Search Wikidata
-        search_url = "https://www.wikidata.org/w/api.php"
-        search_params = {
-            "action": "wbsearchentities",
-            "language": "ja",
-            "format": "json",
-            "search": japanese_name,
-            "limit": 5
-        }
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
-        response = requests.get(search_url, params=search_params, timeout=8, headers=headers)
-        response.raise_for_status()
-        results = response.json().get("search", [])
-        
-        if not results:
-            return None
-        
-        # Get first result
-        entity_id = results[0]["id"]
-        description = results[0].get("description", "").lower()
-        
-        # Check if railway-related
-        railway_keywords = ['station', 'railway', 'train', 'metro', 'line', 'subway', 'transit']
-        is_railway_related = any(keyword in description for keyword in railway_keywords) if description else True
-        
-        if description and not is_railway_related and not has_railway_indicator:
+    with _WIKIDATA_MEMORY_LOCK:
+        cached = _WIKIDATA_MEMORY.get(japanese_name, _MISSING)
+    if cached is not _MISSING:
+        return cached
+    
+    cache = _wikidata_cache()
+    if cache is not None:
+        cached = cache.get(japanese_name, default=_MISSING)
+    if cached is _MISSING:
+        try:
+            cached = _fetch_wikidata_label(japanese_name, has_railway_indicator)
+        except Exception:
+            # Network/API errors aren't cached at any level so the entity is retried next time
+            if raise_errors:
+                raise
             return None
+        if cache is not None:
+            cache.set(japanese_name, cached, expire=_WIKIDATA_CACHE_TTL)
+    
+    with _WIKIDATA_MEMORY_LOCK:
+        _WIKIDATA_MEMORY[japanese_name] = cached
+    return cached
+
+
+def _fetch_wikidata_label(japanese_name: str, has_railway_indicator: bool) -> Optional[str]:
+    """
+    Query Wikidata for the English label of a Japanese entity.
+    
+    Args:
+        japanese_name: Japanese entity name
+        has_railway_indicator: Whether the name itself looks railway-related
         
-        # Get entity data
-        data_url = f"https://www.wikidata.org/wiki/Special:EntityData/{entity_id}.json"
-        response = requests.get(data_url, timeout=8, headers=headers)
-        response.raise_for_status()
-        
-        entity_data = response.json()
-        en_label = entity_data.get("entities", {}).get(entity_id, {}).get("labels", {}).get("en", {}).get("value")
-        
-        return en_label
-        
-    except Exception:
+    Returns:
+        English label if found, None otherwise (request errors propagate)
+    """
+    # Search Wikidata; uselang=en makes each hit carry its English label (if any) as well
+    search_params = {
+        "action": "wbsearchentities",
+        "language": "ja",
+        "uselang": "en",
+        "format": "json",
+        "search": japanese_name,
+        "limit": 5
+    }
+    
+    response = _SESSION.get(_WIKIDATA_API_URL, params=search_params, timeout=8)
+    response.raise_for_status()
+    results = response.json().get("search", [])
+    
+    if not results:
         return None
+    
+    # Get first result
+    result = results[0]
+    entity_id = result["id"]
+    description = result.get("description", "").lower()
+    
+    # Check if railway-related
+    is_railway_related = _RAILWAY_KEYWORD_RE.search(description) is not None if description else True
+    
+    if description and not is_railway_related and not has_railway_indicator:
+        return None
+    
+    # The display label falls back to other languages when there is no English one
+    display_label = result.get("display", {}).get("label", {})
+    if display_label.get("language") == "en":
+        return display_label.get("value")
+    
+    # Otherwise fetch just the English label of the entity
+    label_params = {
+        "action": "wbgetentities",
+        "ids": entity_id,
+        "props": "labels",
+        "languages": "en",
+        "format": "json"
+    }
+    response = _SESSION.get(_WIKIDATA_API_URL, params=label_params, timeout=8)
+    response.raise_for_status()
+    
+    entity_data = response.json()
+    return entity_data.get("entities", {}).get(entity_id, {}).get("labels", {}).get("en", {}).get("value")
 
 
 def translate_entity_with_fallback(
     japanese_entity: str,
-    csv_mapping: Dict[str, str]
+    csv_mapping: Dict[str, str],
+    raise_errors: bool = False
 ) -> str:
     """
     Translate Japanese entity to English using multiple methods.
@@ -137,6 +212,7 @@ def translate_entity_with_fallback(
     Args:
         japanese_entity: Japanese entity to translate
         csv_mapping: CSV entity mapping dictionary
+        raise_errors: Re-raise Wikidata request errors instead of keeping the original
         
     Returns:
         Translated entity or original if not found
@@ -145,21 +221,21 @@ def translate_entity_with_fallback(
     if not japanese_entity:
         return ""
     
-    logger.debug(f"Translating entity: {japanese_entity}")
+    logger.debug("Translating entity: {}", japanese_entity)
     
     # Try CSV mapping first
     if japanese_entity in csv_mapping:
         result = csv_mapping[japanese_entity]
-        logger.debug(f"Entity found in CSV mapping: {japanese_entity} -> {result}")
+        logger.debug("Entity found in CSV mapping: {} -> {}", japanese_entity, result)
         return result
     
     # Try Wikidata
-    logger.debug(f"Entity not in CSV, trying Wikidata: {japanese_entity}")
-    wikidata_result = get_entity_from_wikidata(japanese_entity)
+    logger.debug("Entity not in CSV, trying Wikidata: {}", japanese_entity)
+    wikidata_result = get_entity_from_wikidata(japanese_entity, raise_errors=raise_errors)
     if wikidata_result:
-        logger.info(f"Entity translated via Wikidata: {japanese_entity} -> {wikidata_result}")
+        logger.info("Entity translated via Wikidata: {} -> {}", japanese_entity, wikidata_result)
         return wikidata_result
     
     # Return original if no translation found
-    logger.debug(f"Entity translation not found, keeping original: {japanese_entity}")
+    logger.debug("Entity translation not found, keeping original: {}", japanese_entity)
     return japanese_entity
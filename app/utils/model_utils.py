@@ -0,0 +1,156 @@
+"""
+Model loading utilities shared by the inference services.
+"""
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import torch
+
+# Sequence lengths (in tokens) that inputs are padded to when a model is compiled,
+# so compiled graphs / CUDA graphs see a small fixed set of shapes
+LENGTH_BUCKETS = (32, 64, 128)
+
+
+def row_buckets(max_rows: int) -> Tuple[int, ...]:
+    """
+    Batch sizes that batches are padded to when a model is compiled.
+    
+    Args:
+        max_rows: Largest batch the batcher produces
+        
+    Returns:
+        Powers of two below max_rows, plus max_rows itself (e.g. 1, 2, 4, 8)
+    """
+    sizes = {max(1, max_rows)}
+    size = 1
+    while size < max_rows:
+        sizes.add(size)
+        size *= 2
+    return tuple(sorted(sizes))
+
+
+def round_up_to_bucket(n: int, buckets: Sequence[int]) -> int:
+    """
+    Round n up to the smallest bucket that fits it.
+    
+    Args:
+        n: Size to round
+        buckets: Ascending bucket sizes
+        
+    Returns:
+        Smallest bucket >= n, or n itself if it exceeds every bucket
+    """
+    for bucket in buckets:
+        if n <= bucket:
+            return bucket
+    return n
+
+
+def get_inference_dtype(device: torch.device, precision: str = "auto") -> torch.dtype:
+    """
+    Pick the dtype models are loaded and run in.
+    
+    Args:
+        device: Device the model runs on
+        precision: Requested precision ("auto", "fp32", "fp16", "bf16" or "int8")
+        
+    Returns:
+        float32 on CPU or when fp32 is requested; otherwise the requested half
+        precision, defaulting to bfloat16 on GPUs that support it and float16 on others
+    """
+    if device.type != "cuda" or precision == "fp32":
+        return torch.float32
+    if precision == "fp16":
+        return torch.float16
+    if precision == "bf16" or torch.cuda.is_bf16_supported():
+        return torch.bfloat16
+    return torch.float16
+
+
+def should_quantize(device: torch.device, precision: str = "auto") -> bool:
+    """
+    Whether to apply dynamic INT8 quantization to the model's Linear layers.
+    
+    Args:
+        device: Device the model runs on
+        precision: Requested precision
+        
+    Returns:
+        True on CPU unless a floating point precision was explicitly requested
+    """
+    return device.type == "cpu" and precision in ("auto", "int8")
+
+
+def quantize_linear_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Quantize Linear layers to INT8 weights, with activations quantized on the fly.
+    
+    Args:
+        model: Model in eval mode on CPU
+        
+    Returns:
+        Quantized model
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def freeze_for_cpu(model: torch.nn.Module, example_inputs: Dict[str, torch.Tensor]) -> torch.jit.ScriptModule:
+    """
+    Trace a model to TorchScript, then freeze and optimize it for CPU inference.
+    
+    Freezing inlines the weights as constants, which lets the JIT fold them and
+    fuse ops such as Linear + activation. Outputs come back as a dict, so callers
+    should index outputs by key (outputs["logits"]) rather than by attribute.
+    
+    Args:
+        model: Model in eval mode on CPU
+        example_inputs: Keyword inputs for one forward pass; include padding so
+            the masked attention path is the one that gets traced
+        
+    Returns:
+        Frozen TorchScript module
+    """
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_kwarg_inputs=example_inputs, strict=False)
+        return torch.jit.optimize_for_inference(traced)
+
+
+def load_onnx_seq2seq(model_name: str, device: torch.device, cache_dir: str):
+    """
+    Load a seq2seq model as an optimized ONNX Runtime model.
+    
+    The first run exports the model to ONNX and applies all graph optimizations
+    (fused attention, bias/GELU/LayerNorm fusions; fp16 on GPU). The result is
+    saved under cache_dir, and later runs load it from there.
+    
+    Args:
+        model_name: Hugging Face model name or path
+        device: Device the model runs on
+        cache_dir: Directory optimized models are stored in
+        
+    Returns:
+        ORTModelForSeq2SeqLM exposing the usual generate() API
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTOptimizer
+        from optimum.onnxruntime.configuration import OptimizationConfig
+    except ImportError as e:
+        raise RuntimeError(
+            f"ONNX Runtime support requires optimum[onnxruntime] (or optimum[onnxruntime-gpu]): {e}"
+        )
+    
+    on_gpu = device.type == "cuda"
+    provider = "CUDAExecutionProvider" if on_gpu else "CPUExecutionProvider"
+    save_dir = Path(cache_dir) / model_name.replace("/", "--") / ("gpu" if on_gpu else "cpu")
+    
+    if not (save_dir / "config.json").exists():
+        model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, provider=provider)
+        ORTOptimizer.from_pretrained(model).optimize(
+            save_dir=save_dir,
+            optimization_config=OptimizationConfig(
+                optimization_level=99, fp16=on_gpu, optimize_for_gpu=on_gpu
+            )
+        )
+        model.generation_config.save_pretrained(save_dir)
+    
+    return ORTModelForSeq2SeqLM.from_pretrained(save_dir, provider=provider)
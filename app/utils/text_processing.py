@@ -1,9 +1,16 @@
 """
 Text preprocessing utilities for Japanese text.
 """
+import operator
 import re
+import threading
+import ahocorasick
 import MeCab
-from typing import List
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional
+
+# MeCab taggers aren't thread-safe, so each thread keeps its own
+_TAGGERS = threading.local()
 
 
 def setup_mecab() -> MeCab.Tagger:
@@ -15,17 +22,27 @@ def setup_mecab() -> MeCab.Tagger:
         raise RuntimeError(f"Failed to initialize MeCab: {e}")
 
 
-def tokenize_japanese_text(text: str, mecab: MeCab.Tagger) -> List[str]:
+def get_tagger() -> MeCab.Tagger:
+    """Get the calling thread's MeCab tagger, creating it on first use."""
+    tagger = getattr(_TAGGERS, "tagger", None)
+    if tagger is None:
+        tagger = _TAGGERS.tagger = setup_mecab()
+    return tagger
+
+
+def tokenize_japanese_text(text: str, mecab: Optional[MeCab.Tagger] = None) -> List[str]:
     """
     Tokenize Japanese text using MeCab.
     
     Args:
         text: Japanese text to tokenize
-        mecab: MeCab tagger instance
+        mecab: MeCab tagger instance (default: the calling thread's shared tagger)
         
     Returns:
         List of tokens
     """
+    if mecab is None:
+        mecab = get_tagger()
     try:
         tokens = mecab.parse(text).strip().split()
         return tokens
@@ -33,6 +50,24 @@ def tokenize_japanese_text(text: str, mecab: MeCab.Tagger) -> List[str]:
         raise ValueError(f"Failed to tokenize text: {e}")
 
 
+def split_sentences(text: str) -> List[str]:
+    """
+    Split Japanese text into sentences, keeping the sentence-final punctuation.
+    
+    Args:
+        text: Japanese text to split
+        
+    Returns:
+        List of non-empty sentences
+    """
+    return [s.strip() for s in re.findall(r'[^。！？!?]+[。！？!?]*', text) if s.strip()]
+
+
+# Checked in order, so longer suffixes come before their own tails
+_SUFFIXES = ("方面行き", "方面", "行き")
+_NUM_SPLIT_PATTERN = re.compile(r"^(.+?)(\d+号)$")
+
+
 def normalize_entity(entity_text: str) -> List[str]:
     """
     Normalize entity: strip suffix + split number.
@@ -43,17 +78,14 @@ def normalize_entity(entity_text: str) -> List[str]:
     Returns:
         List of normalized entities
     """
-    suffixes_to_strip = ["方面行き", "方面", "行き"]
-    num_split_pattern = re.compile(r"^(.+?)(\d+号)$")
-    
     # Strip suffixes
-    for suffix in suffixes_to_strip:
+    for suffix in _SUFFIXES:
         if entity_text.endswith(suffix):
             entity_text = entity_text[:-len(suffix)]
             break
     
     # Split numbers
-    match = num_split_pattern.match(entity_text)
+    match = _NUM_SPLIT_PATTERN.match(entity_text)
     if match:
         base, suffix = match.groups()
         return [base, suffix]
@@ -61,6 +93,173 @@ def normalize_entity(entity_text: str) -> List[str]:
         return [entity_text]
 
 
+@lru_cache(maxsize=1024)
+def _build_automaton(keys: FrozenSet[str]) -> ahocorasick.Automaton:
+    """Build an Aho-Corasick automaton matching all keys."""
+    automaton = ahocorasick.Automaton()
+    for key in keys:
+        automaton.add_word(key, key)
+    automaton.make_automaton()
+    return automaton
+
+
+def find_first_occurrences(text: str, patterns: List[str]) -> Dict[str, int]:
+    """
+    Find the first occurrence of each pattern in a single pass over the text.
+    
+    Args:
+        text: Text to search
+        patterns: Substrings to look for
+        
+    Returns:
+        Dictionary mapping each pattern found in text to its first start offset
+    """
+    keys = frozenset(p for p in patterns if p)
+    if not keys:
+        return {}
+    
+    # Matches are reported in order of end offset, so the first hit per key is its earliest
+    first_pos = {}
+    for end_idx, key in _build_automaton(keys).iter(text):
+        if key not in first_pos:
+            first_pos[key] = end_idx - len(key) + 1
+    
+    return first_pos
+
+
+def replace_all(text: str, mapping: Dict[str, str]) -> str:
+    """
+    Replace every occurrence of the mapping keys in a single left-to-right pass.
+    
+    Overlapping keys resolve leftmost-longest, so a longer key wins over a
+    key it contains.
+    
+    Args:
+        text: Text to process
+        mapping: Substring to replacement mapping
+        
+    Returns:
+        Text with all keys replaced by their values
+    """
+    keys = frozenset(k for k in mapping if k)
+    if not keys:
+        return text
+    
+    # Longest key starting at each offset (the automaton's iter_long can miss matches)
+    longest_at = {}
+    for end_idx, key in _build_automaton(keys).iter(text):
+        start = end_idx - len(key) + 1
+        if len(key) > len(longest_at.get(start, "")):
+            longest_at[start] = key
+    
+    parts = []
+    last = 0
+    for start in sorted(longest_at):
+        if start < last:
+            continue
+        key = longest_at[start]
+        parts.append(text[last:start])
+        parts.append(mapping[key])
+        last = start + len(key)
+    parts.append(text[last:])
+    
+    return "".join(parts)
+
+
+# Patterns used by remove_adjacent_duplicate_phrases, compiled once at import
+_COMMA_SPACE_PATTERN = re.compile(r'\s+,')
+_WORD_PATTERN = re.compile(r'\w+')
+_PHRASE_WORD_PATTERN = re.compile(r"([\w\-']+)")
+_PHRASE_GAP_PATTERN = re.compile(r'\s+|, ?')
+_PHRASE_JOINER_PATTERN = re.compile(r"[\-']")
+_WORD_BOUNDARY_PATTERN = re.compile(r"\b(?=[\w\-'])")
+_WORD_END_PATTERN = re.compile(r'\w\b')
+_SINGLE_WORD_DUP_PATTERN = re.compile(r'\b(\w+)(,? \1\b)', flags=re.IGNORECASE)
+_MULTI_SPACE_PATTERN = re.compile(r'\s{2,}')
+_SPACE_BEFORE_PUNCT_PATTERN = re.compile(r'\s+([.,;:!?])')
+
+
+def _repeat_length(lowered: List[str], gaps: List[str], i: int, n: int) -> int:
+    """
+    Match the n words at lowered[i] against the n words that follow them.
+    
+    The separators inside both copies must be identical whitespace/commas.
+    Copies are delimited by word boundaries, as with a regex \\b: the first copy
+    may start inside a hyphenated or apostrophized word ("known" or "-known" in
+    "well-known") and the second may end inside one ("train" in "train-line").
+    Returns how many characters of the second copy's last word belong to the
+    repeat, or 0 if the words don't repeat.
+    """
+    first, last = lowered[i], lowered[i + 2 * n - 1]
+    if n == 1:
+        # The copy is a tail of the first word and a head of the second; try
+        # the longest tail first, like a leftmost regex match
+        for match in _WORD_BOUNDARY_PATTERN.finditer(first):
+            tail = first[match.start():]
+            if last.startswith(tail) and _WORD_END_PATTERN.match(last, len(tail) - 1):
+                return len(tail)
+        return 0
+    
+    head, end = lowered[i + n], lowered[i + n - 1]
+    start = len(first) - len(head)
+    if (
+        start >= 0
+        and first.endswith(head)
+        and _WORD_BOUNDARY_PATTERN.match(first, start)
+        and lowered[i + 1:i + n - 1] == lowered[i + n + 1:i + 2 * n - 1]
+        and last.startswith(end)
+        and _WORD_END_PATTERN.match(last, len(end) - 1)
+        and gaps[i + 1:i + n] == gaps[i + n + 1:i + 2 * n]
+        and all(_PHRASE_GAP_PATTERN.fullmatch(gap) for gap in gaps[i + 1:i + n])
+    ):
+        return len(end)
+    return 0
+
+
+def _remove_repeats(words: List[str], lowered: List[str], gaps: List[str], n: int) -> None:
+    """
+    Drop every immediately repeated n-word phrase, in place.
+    
+    The text is words interleaved with gaps (gaps[j] precedes words[j], gaps[-1]
+    trails); lowered holds the lowercased words and is kept in sync. A repeat is
+    two copies that match case-insensitively (see _repeat_length), joined by a
+    single space or ", ".
+    One left-to-right walk: after a removal the scan backs up just far enough
+    to catch repeats the removal created.
+    """
+    # A repeat needs a word ending with the word n positions later, or for single
+    # words, one that the next word starts with, or two hyphenated/apostrophized
+    # neighbours; these checks run entirely in C and skip the Python-level walk
+    # for most phrase lengths
+    if not any(map(str.endswith, lowered, lowered[n:])):
+        if n > 1:
+            return
+        joined = list(map(bool, map(_PHRASE_JOINER_PATTERN.search, lowered)))
+        if not any(map(str.startswith, lowered[1:], lowered)) and not any(
+            map(operator.and_, joined, joined[1:])
+        ):
+            return
+    
+    i = 0
+    while i + 2 * n <= len(words):
+        second = i + n
+        length = _repeat_length(lowered, gaps, i, n) if gaps[second] in (" ", ", ") else 0
+        if length:
+            # Whatever follows the repeat in the second copy's last word stays,
+            # attached to the first copy ("train train-line" -> "train-line")
+            last = second + n - 1
+            rest = len(lowered[last]) - length
+            if rest:
+                words[second - 1] += words[last][-rest:]
+                lowered[second - 1] += lowered[last][-rest:]
+            # Remove the second copy together with the separators in front of its words
+            del words[second:second + n], lowered[second:second + n], gaps[second:second + n]
+            # A lengthened word can also end a repeat, one position further back
+            i = max(0, i - n if rest else i - n + 1)
+        else:
+            i += 1
+
+
 def remove_adjacent_duplicate_phrases(text: str, max_phrase_len: int = 5) -> str:
     """
     Remove adjacent duplicate phrases in text.
@@ -73,24 +272,25 @@ def remove_adjacent_duplicate_phrases(text: str, max_phrase_len: int = 5) -> str
         Text with duplicates removed
     """
     # Remove extra spaces around commas
-    text = re.sub(r'\s+,', ',', text)
-    
-    # Process phrase repetitions, decreasing from longest to single words
-    for n in range(max_phrase_len, 0, -1):
-        pattern = re.compile(
-            r'(\b(?:[\w\-\'ōū]+(?:\s+|, ?)){%d}[\w\-\'ōū]+\b)'
-            r'(,? \1\b)'
-            % (n-1),
-            flags=re.IGNORECASE
-        )
-        while pattern.search(text):
-            text = pattern.sub(r'\1', text)
-    
-    # Handle single word repetitions
-    text = re.sub(r'\b(\w+)(,? \1\b)', r'\1', text, flags=re.IGNORECASE)
+    text = _COMMA_SPACE_PATTERN.sub(',', text)
+    
+    # An adjacent duplicate phrase needs at least one repeated word; skip the scan otherwise
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(set(words)) < len(words):
+        # Split into words and the separators between them, so the text can be
+        # reassembled exactly; then process phrase repetitions from longest to single words
+        parts = _PHRASE_WORD_PATTERN.split(text)
+        gaps, words = parts[::2], parts[1::2]
+        lowered = [word.lower() for word in words]
+        for n in range(max_phrase_len, 0, -1):
+            _remove_repeats(words, lowered, gaps, n)
+        text = "".join(gap + word for gap, word in zip(gaps, words)) + gaps[-1]
+        
+        # Handle single word repetitions
+        text = _SINGLE_WORD_DUP_PATTERN.sub(r'\1', text)
     
     # Fix punctuation and spacing
-    text = re.sub(r'\s{2,}', ' ', text)
-    text = re.sub(r'\s+([.,;:!?])', r'\1', text)
+    text = _MULTI_SPACE_PATTERN.sub(' ', text)
+    text = _SPACE_BEFORE_PUNCT_PATTERN.sub(r'\1', text)
     
     return text.strip()